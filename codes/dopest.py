@@ -26,6 +26,7 @@
 ## RINEX observations WITH Doppler (pseudorange rate) estimates, saved as a  ##
 ## dictionary of epochs, each epoch with a sub dictionary of GPS satellites  ##
 ## based on SV IDs, each SV ID with also a sub dictionary of observations.   ##
+## The input dictionary is not copied; D1/D2 are added to it in place.       ##
 ##                                                                           ##
 ## Output = {epoch1:{5:{'L1':123,'D1':123, ... 'L4':321,'flag':'none'}...}...##
 ##           epoch2:{3:{'L1':123,'D1':123, ... 'L4':321,'flag':'slip'}...}...##
@@ -38,91 +39,166 @@
 ###############################################################################
 '''
 
-import copy
 import numpy as np
-import warnings
+import numpy.polynomial.polynomial as P
+
+''' The main function that estimates Doppler values from carrier phases '''
 
 def dopest(rnxdata, goodsats, tstart, tstop, rnxstep, inps):
     
-    warnings.simplefilter('ignore', np.RankWarning) # Ignore polyfit warnings
     freqnum = inps['freq'] # Single frequency or dual frequency processing?
-    rnxout = copy.deepcopy(rnxdata) # Copy the input RINEX dictionary
-    dopp_condition = False # Condition for performing Doppler estimation.
+    rnxout = rnxdata # The input RINEX dictionary is updated in place
     print('Estimating Doppler (pseudorange rate) values. \n')
     
-    # For each frequency L1/L2...
-    for f in range(1,1+freqnum):
+    # Integer codes of the carrier phase flags marked by phasep.py, which
+    # are dispatched on when finding the arcs of continuous carrier phase.
+    # 0 = SV not observed in that epoch, 1 = isolated L value (solo/slip),
+    # 2 = start of an arc, 3 = within an arc, 4 = end of an arc.
+    flagcodes = {'solo':1, 'slip':1, 'start':2, 'none':3, 'end':4}
+    
+    epochs = list(rnxout) # List of all epochs, in chronological order
+    
+    # Observation keys of the carrier phase and Doppler for each frequency.
+    Lkeys = ['L'+str(f) for f in range(1,1+freqnum)] # ['L1', 'L2']
+    Dkeys = ['D'+str(f) for f in range(1,1+freqnum)] # ['D1', 'D2']
+    
+    # Materialise the carrier phases as a (frequency, SV, epoch) array,
+    # with NaNs for epochs where the SV is not observed. Epochs are kept as
+    # the last axis so that each arc of a satellite is a contiguous slice.
+    L_arr = np.full((freqnum, len(goodsats), len(epochs)), np.nan)
+    F_arr = np.zeros((len(goodsats), len(epochs)), dtype=int)
+    
+    # Across all time...
+    for j in range(len(epochs)):
+        
+        t = epochs[j] # The current epoch
         
         # For each GPS satellite...
-        for p in goodsats:
+        for i in range(len(goodsats)):
             
-            L = [] # Initialise the carrier phase array.
+            p = goodsats[i] # The current SV ID
             
-            # Across all time...
-            for t in rnxout:
+            if p in rnxout[t]:
                 
-                # If we have at least two L values, we can estimate D values.
-                # All observed satellites must have an assigned Doppler value.
-                # Invalid Doppler values will be replaced with a 'NaN' string.
+                obs = rnxout[t][p] # Observations of this SV at this epoch
                 
-                if p in rnxout[t]:
-                    
-                    # Retrieve the flag marked by phasep.py
-                    flag = rnxout[t][p]['flag']
-                    
-                    # We must isolate single L values from the observations.
-                    # Because, single points cannot be interpolated.
-                    if flag == 'solo' or flag == 'slip':
-                        rnxout[t][p]['D'+str(f)] = 'NaN'
-                        dopp_condition = False # Not ready yet
-                        
-                    # Then, we handle the other cases.
-                    else:
-                        
-                        if flag == 'start':
-                            L = [] # Reset the carrier phase array.
-                            dopp_condition = False # Not ready yet
-                        if flag == 'none':
-                            dopp_condition = False # Not ready yet
-                        if flag == 'end':
-                            dopp_condition = True # Ready for processing!
-                            
-                        # Now, we append the carrier phase values.
-                        if 'L'+str(f) in rnxout[t][p]:
-                            L.append(rnxout[t][p]['L'+str(f)])
-                            
-                        else:
-                            print('Error! Missing L'+str(f)+'value in epoch:')
-                            print(str(t))
-                            return False
+                # Retrieve the flag marked by phasep.py
+                F_arr[i,j] = flagcodes.get(obs['flag'], 3)
                 
-                # Perform the Doppler estimation if L data is ready.
-                if dopp_condition == True:
-                    
-                    # First, let's get the array for time, and phase.
-                    L = np.array(L) # Numpy-rize the carrier phase values
-                    N = np.linspace(0, len(L)-1, len(L)) # Normalised time
-                                        
-                    # We perform polynomial fitting of the carrier phase.
-                    coeff = np.polyfit(N, L, 19) # Polynomial fit
-                    
-                    # Next, we get an array for an infinitesimal step of
-                    # both time and phase (t + delta-t, and L + delta-L).
-                    delta = 0.01 # Delta timestep
-                    N_delta = N + delta # N + delta-N
-                    L_delta = np.polyval(coeff, N_delta) # L + delta-L
-                    
-                    # Estimate Doppler with 1st order derivative of L
-                    D = ((L-L_delta)/(delta*float(rnxstep.seconds))).tolist()
-                    d = 0 # To be used as a counter later for indexing
-                    
-                    # Now, we want to plug these values back into rnxout.
-                    for k in reversed(range(0,len(D))):
-                        rnxout[t-(k*rnxstep)][p]['D'+str(f)] = D[d]
-                        d += 1 # Update the count
-                    
-                    L = [] # Reset the carrier phase values array.
-                    dopp_condition = False # Reset the condition.
+                # For each frequency L1/L2, retrieve the carrier phase.
+                for f in range(freqnum):
+                    if Lkeys[f] in obs:
+                        L_arr[f,i,j] = obs[Lkeys[f]]
+                    else:
+                        print('Error! Missing '+Lkeys[f]+' value in epoch:')
+                        print(str(t))
+                        return False
+    
+    # Invalid Doppler values will remain as NaNs in this array.
+    D_arr = np.full(L_arr.shape, np.nan)
+    
+    # Arcs of continuous carrier phase, grouped by their lengths, so that
+    # all arcs of equal length can be fitted on the same time grid.
+    arcs = {} # {arc length: [(SV index, start epoch index), ...]}
+    
+    # For each GPS satellite...
+    for i in range(len(goodsats)):
+        
+        arcstart = None # Index of the epoch starting the current arc
+        
+        # Across all time, find the arcs of continuous carrier phase.
+        for j, flag in enumerate(F_arr[i].tolist()):
+            
+            # Open a new arc at its start.
+            if flag == 2:
+                arcstart = j
+            
+            # Close the arc at its end, if it was opened by a start.
+            # Arcs of a single L value cannot be differentiated.
+            elif flag == 4:
+                if arcstart is not None:
+                    arcs.setdefault(j-arcstart+1, []).append((i, arcstart))
+                arcstart = None
+            
+            # We must isolate single L values ('solo' or 'slip') from the
+            # observations. Because, single points cannot be interpolated.
+            elif flag == 1:
+                arcstart = None
+    
+    dt = float(rnxstep.seconds) # Time step between epochs
+    
+    # For all arcs of the same length...
+    for n in arcs:
+        
+        # Indices of the SVs and epochs of each arc (one per column).
+        K = len(arcs[n]) # Number of arcs of this length
+        SV_idx = np.array([arc[0] for arc in arcs[n]])
+        ep_idx = np.array([arc[1] for arc in arcs[n]])
+        ep_idx = ep_idx + np.arange(n)[:,None]
+        
+        # The carrier phase values of each arc and of each frequency L1/L2,
+        # stacked column-wise, so that both frequencies share the same fit.
+        L = np.hstack(L_arr[:,SV_idx,ep_idx]) # Size: n x (freqnum * K)
+        
+        # Fit all arcs, and estimate their Doppler values together.
+        Dn = dopfit(L, dt) # Size: n x (freqnum * K)
+        D_arr[:,SV_idx,ep_idx] = Dn.reshape(n, freqnum, K).transpose(1,0,2)
+    
+    # Now, we want to plug these values back into rnxout, in a single pass.
+    # All observed satellites must have an assigned Doppler value.
+    # Invalid Doppler values will be replaced with a 'NaN' string.
+    D_obj = D_arr.astype(object) # Python floats, to allow for strings
+    D_obj[np.isnan(D_arr)] = 'NaN' # Replace NaNs with 'NaN' strings
+    D_list = D_obj.tolist() # Nested list of Doppler values
+    
+    # For each GPS satellite...
+    for i in range(len(goodsats)):
+        
+        p = goodsats[i] # The current SV ID
+        
+        # Epochs where this SV is observed, and their indices.
+        obs_idx = np.flatnonzero(F_arr[i]).tolist()
+        obs_epochs = [epochs[j] for j in obs_idx]
+        
+        # For each frequency L1/L2, assign the Doppler values.
+        for f in range(freqnum):
+            Dkey = Dkeys[f] # Either 'D1' or 'D2'
+            D_obs = [D_list[f][i][j] for j in obs_idx]
+            for t, Dval in zip(obs_epochs, D_obs):
+                rnxout[t][p][Dkey] = Dval
     
     print('Doppler (pseudorange rate) estimation completed. \n')
-    return rnxout
\ No newline at end of file
+    return rnxout
+
+''' Polynomial fitting of carrier phase arcs, and their 1st derivatives '''
+
+def dopfit(L, dt):
+    
+    # L is an n x K array of K carrier phase arcs, all of the same length n
+    # dt is the time step between two epochs, in seconds
+    # Returns an n x K array of Doppler estimates for each arc
+    
+    n = L.shape[0] # Length of each arc
+    
+    # Normalised time of the arc, and its scaling to [-1, 1], so that the
+    # least squares problem remains well-conditioned.
+    # The polynomial degree is also capped by the arc length.
+    N = np.arange(n, dtype=np.float64) # Normalised time
+    x = 2*N/(n-1) - 1 # Normalised time scaled to [-1, 1]
+    deg = min(19, n-1) # Polynomial degree
+    
+    # We perform polynomial fitting of all arcs in one go, with the
+    # Vandermonde matrix of the shared time grid (computed only once).
+    # Coefficients are in ascending order of powers, column-wise per arc.
+    V = P.polyvander(x, deg) # Vandermonde matrix
+    C = np.linalg.lstsq(V, L, rcond=None)[0] # Coefficients
+    
+    # Differentiate the fitted polynomials analytically, with respect to
+    # the normalised time N (hence the scaling of dx/dN).
+    Cd = P.polyder(C, scl=2/(n-1)) # Coefficients
+    
+    # Estimate Doppler with 1st order derivative of L, where all arcs
+    # are evaluated together on the shared time grid.
+    Ld = P.polyval(x, Cd).T # Phase rate per epoch step
+    
+    return -Ld / dt
\ No newline at end of file
@@ -24,85 +24,49 @@
 ###############################################################################
 '''
 
+import os
 import datetime
+import numpy as np
 import matplotlib.pyplot as plt
-from decimal import Decimal
 
 def gps_report(gpsdata, goodsats, inps):
     
     cwd = inps['cwd'] # Get current main working directory
     
-    file_path = open(cwd+'\\output\\gps_report\\GPS_Report.txt', 'w')
+    path = os.path.join(cwd, 'output', 'gps_report', 'GPS_Report.txt')
     
-    line = 'G         '
-    line += 'Pos_X (km)       '
-    line += 'Pos_Y (km)       '
-    line += 'Pos_Z (km)     '
-    line += 'Vel_X (km/s)     '
-    line += 'Vel_Y (km/s)     '
-    line += 'Vel_Z (km/s)     '
-    line += '    Clk_Bias \n'
-    file_path.write(line)
+    # The report is written in large blocks, so use a large write buffer.
+    file_path = open(path, 'w', buffering=1<<20)
+    
+    header = ['G         ',
+              'Pos_X (km)       ',
+              'Pos_Y (km)       ',
+              'Pos_Z (km)     ',
+              'Vel_X (km/s)     ',
+              'Vel_Y (km/s)     ',
+              'Vel_Z (km/s)     ',
+              '    Clk_Bias \n']
+    file_path.write(''.join(header))
     
     # It's all string formatting from here... nothing scientific.
+    # Each row holds the SV ID, position, velocity and clock bias, where
+    # the clock bias has a leading space for its sign.
+    keys = ['px','py','pz','vx','vy','vz','clkb']
+    rowfmt = 'G%02d' + ' %16.6f' * 6 + ' % .9E '
+    
     for t in gpsdata:
         
-        line = '\n'
-        line += '*  '
-        line += str(t.year) + ' '
-        line += str(t.month) + ' '
-        line += str(t.day) + ' '
-        line += str(t.hour) + ' '
-        line += str(t.minute) + ' '
-        line += str(t.second) + '\n'
-        file_path.write(line)
-
-        for p in goodsats:
-            
-            if p < 10:
-                pstr = '0' + str(p)
-            else:
-                pstr = str(p)
-                
-            # Write in position information
-            line = 'G' + pstr + ' '
-            
-            for coord in ['x','y','z']:
-                pos = str(gpsdata[t][p]['p' + coord])
-                dot = pos.index('.')
-                if len(pos[dot:]) > 7:
-                    pos = pos[:dot+7]
-                while len(pos[dot:]) < 7:
-                    pos = pos + '0'
-                while len(pos[:dot]) < 9:
-                    pos = ' ' + pos
-                    dot = pos.index('.')
-                pos = pos + ' '
-                line += pos
-                            
-            for coord in ['x','y','z']:
-                vel = str(gpsdata[t][p]['v' + coord])
-                dot = vel.index('.')
-                if len(vel[dot:]) > 7:
-                    vel = vel[:dot+7]
-                while len(vel[dot:]) < 7:
-                    vel = vel + '0'
-                while len(vel[:dot]) < 9:
-                    vel = ' ' + vel
-                    dot = vel.index('.')
-                vel = vel + ' '
-                line += vel
-            
-            b = '%.9E' % Decimal(str(gpsdata[t][p]['clkb']))
-            dot = b.index('.')
-            while len(b[:dot]) < 2:
-                b = ' ' + b
-                dot = b.index('.')
-                
-            line += str(b)
-            line += ' \n'
-            file_path.write(line)
-            
+        # Gather the SV IDs, positions, velocities and clock biases of this
+        # epoch only, into a block of size: (SVs) x 8. This avoids keeping
+        # a second full copy of 'gpsdata' in memory while reporting.
+        block = np.array([[p] + [gpsdata[t][p][k] for k in keys]
+                          for p in goodsats], dtype=float)
+        
+        # Write in the epoch, followed by the block of rows of all SVs.
+        file_path.write(f'\n*  {t.year} {t.month} {t.day} '
+                        f'{t.hour} {t.minute} {t.second}\n')
+        np.savetxt(file_path, block, fmt=rowfmt)
+    
     file_path.close()
     return None
 
@@ -116,14 +80,11 @@ def gps_graphs(SV, t_usr_dt, t_usr_ss, gpsdata, inps):
     # Initialise the 1x3 subplot for PVT data.
     fig, (ax1, ax2, ax3) = plt.subplots(3,1,figsize=(12,8))
         
-    # Get the positions, velocities, and clock biases.
-    px = [gpsdata[t][SV]['px'] for t in t_usr_dt]
-    py = [gpsdata[t][SV]['py'] for t in t_usr_dt]
-    pz = [gpsdata[t][SV]['pz'] for t in t_usr_dt]
-    vx = [gpsdata[t][SV]['vx'] for t in t_usr_dt]
-    vy = [gpsdata[t][SV]['vy'] for t in t_usr_dt]
-    vz = [gpsdata[t][SV]['vz'] for t in t_usr_dt]
-    clkb = [gpsdata[t][SV]['clkb'] for t in t_usr_dt]
+    # Get the positions, velocities, and clock biases, in a single pass.
+    keys = ['px','py','pz','vx','vy','vz','clkb']
+    rows = [gpsdata[t][SV] for t in t_usr_dt]
+    pvt = np.array([[row[k] for k in keys] for row in rows])
+    px, py, pz, vx, vy, vz, clkb = pvt.T
     
     # Position plots
     ax1.set_title('SV ' + str(SV) + ' Position (km)')
@@ -146,7 +107,8 @@ def gps_graphs(SV, t_usr_dt, t_usr_ss, gpsdata, inps):
     
     # Tight-spaced plot
     plt.tight_layout()
-    plt.savefig(cwd + '\\output\\gps_plots\\GPS_SV' + str(SV) + '_PVT.png')
+    plt.savefig(os.path.join(cwd, 'output', 'gps_plots',
+                             'GPS_SV' + str(SV) + '_PVT.png'))
     
     # Close this figure
     plt.close(fig)
@@ -158,98 +120,63 @@ def leo_results(results, inps):
     print('Saving final report on both LEOs and their baselines \n')
     
     cwd = inps['cwd'] # Get current main working directory
-    file_path = open(cwd+'\\output\\LEOGPS_Results.txt', 'w')
-    
-    line  = 'Date      '
-    line += '     Time     '
-    
-    # Headers for LEO 1
-    line += inps['name1'] + '_PosX     '
-    line += inps['name1'] + '_PosY     '
-    line += inps['name1'] + '_PosZ     '
-    line += inps['name1'] + '_VelX     '
-    line += inps['name1'] + '_VelY     '
-    line += inps['name1'] + '_VelZ     '
-    line += inps['name1'] + '_GDOP     '
-    line += inps['name1'] + '_PDOP     '
-    line += inps['name1'] + '_TDOP         '
-    line += inps['name1'] + '_ClkB     '
-    
-    # Headers for LEO 2
-    line += inps['name2'] + '_PosX     '
-    line += inps['name2'] + '_PosY     '
-    line += inps['name2'] + '_PosZ     '
-    line += inps['name2'] + '_VelX     '
-    line += inps['name2'] + '_VelY     '
-    line += inps['name2'] + '_VelZ     '
-    line += inps['name2'] + '_GDOP     '
-    line += inps['name2'] + '_PDOP     '
-    line += inps['name2'] + '_TDOP         '
-    line += inps['name2'] + '_ClkB     '
+    path = os.path.join(cwd, 'output', 'LEOGPS_Results.txt')
+    
+    # The results are written in large blocks, so use a large write buffer.
+    file_path = open(path, 'w', buffering=1<<20)
+    
+    header = ['Date      ', '     Time     ']
+    
+    # Headers for LEO 1 and LEO 2
+    for name in [inps['name1'], inps['name2']]:
+        header += [name + '_PosX     ',
+                   name + '_PosY     ',
+                   name + '_PosZ     ',
+                   name + '_VelX     ',
+                   name + '_VelY     ',
+                   name + '_VelZ     ',
+                   name + '_GDOP     ',
+                   name + '_PDOP     ',
+                   name + '_TDOP         ',
+                   name + '_ClkB     ']
     
     # Headers for baseline information
-    line += 'RelativeX     '
-    line += 'RelativeY     '
-    line += 'RelativeZ     '
-    line += '\n'
-    file_path.write(line)
+    header += ['RelativeX     ', 'RelativeY     ', 'RelativeZ     ', '\n']
+    file_path.write(''.join(header))
     
     # It's all string formatting from here... nothing scientific.
-    for t in results:
+    # Lines are buffered and written in a single call at the end.
+    lines = []
+    
+    # The results are logged in chronological order by leorun.py, with the
+    # same layout of vectors at every epoch. So we check only once which
+    # vectors are 1x3 POS/VEL/DOP, and which are 1x1 clock bias entries.
+    first = next(iter(results.values()), []) # Vectors of the first epoch
+    is_vec3 = [len(vector) >= 3 for vector in first]
+    
+    for t, vectors in results.items():
         
-        line  = str(t) # Date-time string (dictionary key)
+        line = [str(t)] # Date-time string (dictionary key)
         
         # Within each vector...
-        for vector in results[t]:
+        for vector, vec3 in zip(vectors, is_vec3):
             
             # Check if the vector is a 1x3 POS/VEL/DOP
-            if len(vector) >= 3:
+            if vec3:
                 for value in vector[:3]:
-                    svalue = str(value)
-                    dot = svalue.index('.')
-                    if len(svalue[dot:]) > 4:
-                        svalue = svalue[:dot+4]
-                    while len(svalue[dot:]) < 4:
-                        svalue = svalue + '0'
-                    while len(svalue[:dot]) < 10:
-                        svalue = ' ' + svalue
-                        dot = svalue.index('.')
-                    line += svalue
+                    line.append(f'{value:14.3f}')
                     
-            # Or the clock bias entry (1x1)
+            # Or the clock bias entry (1x1), converted to seconds
             else:
-                for value in vector[:1]:
-                    svalue = str(value/299792458.0)
-                    dot = svalue.index('.')
-                    
-                    # Check if clock bias is in standard notation
-                    if 'e' in svalue:
-                        edot = svalue.index('e')
-                        svalue1 = svalue[:dot]
-                        svalue2 = svalue[dot:edot]
-                        if len(svalue2) > 7:
-                            svalue2 = svalue2[:7]
-                        svalue3 = svalue[edot:]
-                        svalue = svalue1 + svalue2 + svalue3
-                    
-                    # Else, if it is in decimal...
-                    else:
-                        if len(svalue[dot:]) > 11:
-                            svalue = svalue[:dot+11]
-                        while len(svalue[dot:]) < 11:
-                            svalue = svalue + '0'
-                    
-                    while len(svalue[:dot]) < 7:
-                        svalue = ' ' + svalue
-                        dot = svalue.index('.')
-                    line += svalue
-                
-        line += ' \n'
-        file_path.write(line)
+                line.append(f'{vector[0]/299792458.0:18.6e}')
+        
+        line.append(' \n')
+        lines.append(''.join(line))
     
+    file_path.writelines(lines)
     file_path.close()
     
     print('Completed processing in LEOGPS! Output file stored:')
-    print(cwd+'\\output\\LEOGPS_Results.txt \n')
+    print(path + ' \n')
     
     return None
\ No newline at end of file